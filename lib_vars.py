@@ -13,36 +13,59 @@ plugin_name = None                      # Plugin name
 plugin_dir = None                       # Plugin folder path
 user_folder_dir = None                  # User folder path
 logger = None                           # Instance of class GwLogger. Found in "/lib/tools_log.py"
-project_vars = {}                       # Project variables from QgsProject related to Giswater
-project_vars['info_type'] = None        # gwInfoType
-project_vars['add_schema'] = None       # gwAddSchema
-project_vars['main_schema'] = None      # gwMainSchema
-project_vars['project_role'] = None     # gwProjectRole
-project_vars['project_type'] = None     # gwProjectType
-project_vars['store_credentials'] = None  # gwStoreCredentials
 data_epsg = None                        # SRID retrieved from QGIS project layer "v_edit_node"
 project_epsg = None                     # EPSG of QGIS project
+date_format = None                      # Display format of the dates allowed in the forms: dd/MM/yyyy or dd-MM-yyyy or yyyy/MM/dd or yyyy-MM-dd
 
-# region Dynamic Variables (variables may change value during user's session)
-session_vars = {}
-session_vars['last_error'] = None          # An instance of the last database runtime error
-session_vars['last_error_msg'] = None      # An instance of the last database runtime error message used in threads
-session_vars['threads'] = []               # An instance of the different threads for the execution of the Giswater functionalities (type:list)
-session_vars['dialog_docker'] = None       # An instance of GwDocker from "/core/ui/docker.py" which is used to mount a docker form
-session_vars['info_docker'] = None         # An instance of current status of the info docker form configured by user. Can be True or False
-session_vars['docker_type'] = None         # An instance of current status of the docker form configured by user. Can be configured "qgis_info_docker" and "qgis_form_docker"
-session_vars['current_selections'] = None  # An instance of the current selections docker.
-session_vars['logged_status'] = None       # An instance of connection status. Can be True or False
-session_vars['last_focus'] = None          # An instance of the last focused dialog's tag
-# endregion
 
-# region global user variables (values are initialized on load project without changes during session)
-user_level = {                          # An instance used to know user level and user level configuration
-    'level': None,                      # initial=1, normal=2, expert=3
-    'showquestion': None,               # Used for show help (default config show for level 1 and 2)
-    'showsnapmessage': None,            # Used to indicate to the user that they can snapping
-    'showselectmessage': None,          # Used to indicate to the user that they can select
-    'showadminadvanced': None,          # Manage advanced tab, fields manager tab and sample dev radio button from admin
+# region Lazy variables (dictionaries are created on first access, see __getattr__)
+
+# Project variables from QgsProject related to Giswater
+_PROJECT_VARS_KEYS = (
+    'info_type',                        # gwInfoType
+    'add_schema',                       # gwAddSchema
+    'main_schema',                      # gwMainSchema
+    'project_role',                     # gwProjectRole
+    'project_type',                     # gwProjectType
+    'store_credentials',                # gwStoreCredentials
+)
+
+# Dynamic Variables (variables may change value during user's session)
+_SESSION_VARS_KEYS = (
+    'last_error',                       # An instance of the last database runtime error
+    'last_error_msg',                   # An instance of the last database runtime error message used in threads
+    'threads',                          # An instance of the different threads for the execution of the Giswater functionalities (type:list)
+    'dialog_docker',                    # An instance of GwDocker from "/core/ui/docker.py" which is used to mount a docker form
+    'info_docker',                      # An instance of current status of the info docker form configured by user. Can be True or False
+    'docker_type',                      # An instance of current status of the docker form configured by user. Can be configured "qgis_info_docker" and "qgis_form_docker"
+    'current_selections',               # An instance of the current selections docker.
+    'logged_status',                    # An instance of connection status. Can be True or False
+    'last_focus',                       # An instance of the last focused dialog's tag
+)
+
+# Global user variables (values are initialized on load project without changes during session)
+_USER_LEVEL_KEYS = (
+    'level',                            # initial=1, normal=2, expert=3
+    'showquestion',                     # Used for show help (default config show for level 1 and 2)
+    'showsnapmessage',                  # Used to indicate to the user that they can snapping
+    'showselectmessage',                # Used to indicate to the user that they can select
+    'showadminadvanced',                # Manage advanced tab, fields manager tab and sample dev radio button from admin
+)
+
+_DEFAULTS = {
+    'project_vars': lambda: dict.fromkeys(_PROJECT_VARS_KEYS),
+    'session_vars': lambda: dict.fromkeys(_SESSION_VARS_KEYS) | {'threads': []},
+    'user_level': lambda: dict.fromkeys(_USER_LEVEL_KEYS),
 }
-date_format = None                      # Display format of the dates allowed in the forms: dd/MM/yyyy or dd-MM-yyyy or yyyy/MM/dd or yyyy-MM-dd
+
+
+def __getattr__(name):
+    """ Create lazy variables @project_vars, @session_vars and @user_level on first access.
+    They are bound as module globals, so later accesses don't go through this function """
+
+    if name not in _DEFAULTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = globals()[name] = _DEFAULTS[name]()
+    return value
+
 # endregion
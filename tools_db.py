@@ -5,8 +5,12 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
+import threading
+import time
+from operator import itemgetter
+
 from qgis.PyQt.QtSql import QSqlDatabase
-from qgis.core import QgsCredentials, QgsDataSourceUri
+from qgis.core import QgsCredentials, QgsDataSourceUri, QgsProject
 from qgis.PyQt.QtCore import QSettings
 
 from qgis.utils import iface
@@ -18,6 +22,37 @@ from . import tools_log, tools_qt, tools_qgis, tools_pgdao, tools_os
 dao = None
 dao_db_credentials: dict[str, str] = None
 current_user = None
+_users = {}            # Current user of each connection, keyed by backend PID. See get_current_user()
+_users_lock = threading.Lock()
+_catalog_cache = {}     # Catalog lookups {(kind, *names): (expiration time, result)}. See reset_catalog_cache()
+_CATALOG_TTL = 30           # Seconds a found database object is remembered. Missing objects are not cached
+_CATALOG_COLUMNS_TTL = float('inf')  # Columns of a whole schema are kept until reset_catalog_cache()
+_CACHE_MISS = object()
+_server_info = {}       # Server properties of the current connection. See _bootstrap_server_info()
+_extensions = {}        # Result of check_pg_extension() for the current connection, keyed by extension name
+_prepared = {}          # Server-side prepared statements of the current backend, keyed by SQL template (False if PREPARE failed)
+_prepared_pid = None    # Backend PID the prepared statements belong to
+_INVALID_STATEMENT_NAME = '26000'  # SQLSTATE raised by EXECUTE when the prepared statement doesn't exist
+_uri_template = None    # QgsDataSourceUri with the connection part set by get_uri()
+_uri_template_key = None  # Credentials used to build _uri_template
+_credentials_layer_ids = {}  # Id of the layer used to get credentials, keyed by (layer name, main schema)
+_conn_info_cache = {}   # Connection info of the layer data source, keyed by layer id. See _get_layer_conn_info()
+_conn_info_layer_ids = set()  # Layers whose dataSourceChanged signal clears their _conn_info_cache entry
+_conn_info_connected = False  # Whether layersRemoved clears _conn_info_cache
+_QUOTES_TABLE = str.maketrans('', '', '"')
+
+# sslmode stored in QGIS settings (PostgreSQL/connections) => libpq sslmode
+_SSLMODE_SETTINGS_DICT = {
+    0: 'prefer', 1: 'disable', 3: 'require',
+    'SslPrefer': 'prefer', 'SslDisable': 'disable', 'SslRequire': 'require', 'SslAllow': 'allow'
+}
+# libpq sslmode => QgsDataSourceUri.SslMode
+_SSLMODE_URI_DICT = {
+    'prefer': QgsDataSourceUri.SslMode.SslPrefer,
+    'disable': QgsDataSourceUri.SslMode.SslDisable,
+    'require': QgsDataSourceUri.SslMode.SslRequire,
+    'allow': QgsDataSourceUri.SslMode.SslAllow
+}
 
 
 def create_list_for_completer(sql):
@@ -27,28 +62,25 @@ def create_list_for_completer(sql):
         :return: list_items: List with the result of the query executed (List) ["item1","item2","..."]
     """
 
-    rows = get_rows(sql)
-    list_items = []
-    if rows:
-        for row in rows:
-            list_items.append(str(row[0]))
-    return list_items
+    return [str(item) for item in map(itemgetter(0), get_rows_iter(sql))]
 
 
-def check_schema(schemaname=None):
+def check_schema(schemaname=None, force=False):
     """ Check if selected schema exists """
 
-    if schemaname in (None, 'null', ''):
-        schemaname = lib_vars.schema_name
+    schemaname = _get_schema_name(schemaname)
+    key = ('schema', schemaname)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
 
-    schemaname = schemaname.replace('"', '')
     sql = "SELECT nspname FROM pg_namespace WHERE nspname = %s"
     params = [schemaname]
-    row = get_row(sql, params=params)
-    return row
+    row = get_row(sql, params=params, prepare=True)
+    return _cache_catalog(key, row)
 
 
-def check_table(tablename, schemaname=None):
+def check_table(tablename, schemaname=None, force=False):
     """ Check if selected table exists in selected schema """
 
     if schemaname in (None, 'null', ''):
@@ -59,83 +91,136 @@ def check_table(tablename, schemaname=None):
             if schemaname in (None, 'null', ''):
                 return None
 
-    schemaname = schemaname.replace('"', '')
-    sql = "SELECT * FROM pg_tables WHERE schemaname = %s AND tablename = %s"
+    schemaname = _get_schema_name(schemaname)
+    key = ('table', schemaname, tablename)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    sql = ("SELECT 1 FROM pg_class "
+           "WHERE oid = to_regclass(format('%%I.%%I', %s::text, %s::text)) AND relkind IN ('r', 'p')")
     params = [schemaname, tablename]
-    row = get_row(sql, log_info=False, params=params)
-    return row
+    row = get_row(sql, log_info=False, params=params, prepare=True)
+    return _cache_catalog(key, row)
+
+
+def check_tables_bulk(tablenames, schemaname=None):
+    """ Check which of @tablenames exist in selected schema using a single query
+        :return: Set with the names of the existing tables
+    """
+
+    schemaname = _get_schema_name(schemaname)
+    sql = ("SELECT tablename FROM pg_tables "
+           "WHERE schemaname = %s AND tablename::text = ANY(%s::text[])")
+    params = [schemaname, list(tablenames)]
+    rows = get_rows(sql, log_info=False, params=params)
+    found = set()
+    for row in rows or []:
+        found.add(row['tablename'])
+        _cache_catalog(('table', schemaname, row['tablename']), row)
+    return found
 
 
-def check_view(viewname, schemaname=None):
+def check_view(viewname, schemaname=None, force=False):
     """ Check if selected view exists in selected schema """
 
-    if schemaname in (None, 'null', ''):
-        schemaname = lib_vars.schema_name
+    schemaname = _get_schema_name(schemaname)
+    key = ('view', schemaname, viewname)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
 
-    schemaname = schemaname.replace('"', '')
-    sql = ("SELECT * FROM pg_views "
-           "WHERE schemaname = %s AND viewname = %s ")
+    sql = ("SELECT 1 FROM pg_class "
+           "WHERE oid = to_regclass(format('%%I.%%I', %s::text, %s::text)) AND relkind = 'v'")
     params = [schemaname, viewname]
-    row = get_row(sql, log_info=False, params=params)
-    return row
+    row = get_row(sql, log_info=False, params=params, prepare=True)
+    return _cache_catalog(key, row)
 
 
-def check_column(tablename, columname, schemaname=None):
+def check_column(tablename, columname, schemaname=None, force=False):
     """ Check if @columname exists table @schemaname.@tablename """
 
-    if schemaname in (None, 'null', ''):
-        schemaname = lib_vars.schema_name
+    schemaname = _get_schema_name(schemaname)
+    key = ('column', schemaname, tablename, columname)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
 
-    schemaname = schemaname.replace('"', '')
-    sql = ("SELECT * FROM information_schema.columns "
-           "WHERE table_schema = %s AND table_name = %s AND column_name = %s")
+    # Use the columns of the whole schema if they have been loaded (see prefetch_catalog and get_all_columns)
+    if columname in _get_schema_columns(schemaname, force).get(tablename, ()):
+        return (schemaname, tablename, columname)
+
+    sql = ("SELECT 1 FROM information_schema.columns "
+           "WHERE table_schema = %s AND table_name = %s AND column_name = %s LIMIT 1")
     params = [schemaname, tablename, columname]
-    row = get_row(sql, log_info=False, params=params)
-    return row
+    row = get_row(sql, log_info=False, params=params, prepare=True)
+    return _cache_catalog(key, row)
+
+
+def check_columns_bulk(tablename, columnames, schemaname=None):
+    """ Check which of @columnames exist in table @schemaname.@tablename using a single query
+        :return: Set with the names of the existing columns
+    """
+
+    schemaname = _get_schema_name(schemaname)
+    sql = ("SELECT column_name FROM information_schema.columns "
+           "WHERE table_schema = %s AND table_name = %s AND column_name::text = ANY(%s::text[])")
+    params = [schemaname, tablename, list(columnames)]
+    rows = get_rows(sql, log_info=False, params=params)
+    found = set()
+    for row in rows or []:
+        found.add(row['column_name'])
+        _cache_catalog(('column', schemaname, tablename, row['column_name']), row)
+    return found
 
 
-def check_role(role_name, is_admin=None):
+def check_role(role_name, is_admin=None, force=False):
     """ Check if @role_name exists """
 
-    sql = f"SELECT * FROM pg_roles WHERE rolname = '{role_name}'"
-    row = get_row(sql, log_info=False, is_admin=is_admin)
-    return row
+    key = ('role', role_name)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    sql = "SELECT 1 FROM pg_roles WHERE rolname = %s LIMIT 1"
+    params = [role_name]
+    row = get_row(sql, log_info=False, params=params, is_admin=is_admin, prepare=True)
+    return _cache_catalog(key, row)
 
 
 def check_role_user(role_name, username=None):
     """ Check if current user belongs to @role_name """
 
-    global current_user
-    # Check both @role_name and @username exists
-    if not check_role(role_name):
-        return False
-
     if username is None:
-        username = current_user
-
-    if not check_role(username):
+        username = get_current_user()
+
+    # Check both @role_name and @username exists and membership in a single query
+    sql = ("SELECT r.role_exists, u.user_exists, "
+           "CASE WHEN r.role_exists AND u.user_exists THEN pg_has_role(%s, %s, 'MEMBER') END "
+           "FROM (SELECT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = %s) AS role_exists) r, "
+           "(SELECT EXISTS (SELECT 1 FROM pg_roles WHERE rolname = %s) AS user_exists) u")
+    params = [username, role_name, role_name, username]
+    row = get_row(sql, params=params, prepare=True)
+    if not row:
         return False
 
-    sql = ("SELECT pg_has_role('" + username + "', '" + role_name + "', 'MEMBER');")
-    row = get_row(sql)
-    if row:
-        return row[0]
-    else:
+    role_exists, user_exists, has_role = row
+    if not (role_exists and user_exists):
         return False
 
+    return has_role
+
 
 def check_super_user(username=None):
     """ Returns True if @username is a superuser """
 
-    global current_user
     if username is None:
-        username = current_user
+        username = get_current_user()
 
-    if not check_role(username):
-        return False
-
-    sql = f"SELECT usesuper FROM pg_user WHERE usename = '{username}'"
-    row = get_row(sql)
+    # A missing user returns no row
+    sql = "SELECT usesuper FROM pg_user WHERE usename = %s"
+    params = [username]
+    row = get_row(sql, log_info=False, params=params, prepare=True)
     if row:
         return row[0]
     else:
@@ -143,77 +228,155 @@ def check_super_user(username=None):
 
 
 def check_pg_extension(extension, form_enabled=True):
-    sql = f"SELECT extname FROM pg_extension WHERE extname = '{extension}'"
-    row = get_row(sql)
-
-    if not row:
-        sql = f"SELECT name FROM pg_available_extensions WHERE name = '{extension}'"
-        row = get_row(sql)
-        if row and form_enabled:
-            sql = f"CREATE EXTENSION IF NOT EXISTS {extension};"
-            execute_sql(sql)
+    if extension in _server_info.get('extensions', ()):
+        return True, None
 
-            if extension == 'postgis':
-                postgis_version = get_postgis_version()
-                # Check postGis version
-                major_version = postgis_version.split(".")
-                if int(major_version[0]) >= 3:
-                    sql = f"CREATE EXTENSION IF NOT EXISTS postgis_raster;"
-                    execute_sql(sql)
-            return True, None
-        elif form_enabled:
-            message = f"Unable to create '{extension}' extension. Packages must be installed, consult your administrator."
-            return False, message
+    # Installed and available extensions don't change during the connection, unless we create them
+    key = (extension, form_enabled)
+    if key in _extensions:
+        return _extensions[key]
 
-    return True, None
+    _extensions[key] = result = _check_pg_extension(extension, form_enabled)
+    return result
 
 
 def get_current_user():
     """ Get current user connected to database """
 
     global current_user
-    if current_user:
-        return current_user
+    pid = dao.pid if dao else None
+    with _users_lock:
+        cur_user = _users.get(pid)
+        if cur_user is not None:
+            return cur_user
 
-    sql = "SELECT current_user"
-    row = get_row(sql)
-    cur_user = ""
-    if row:
-        cur_user = str(row[0])
-    current_user = cur_user
+        sql = "SELECT current_user"
+        row = get_row(sql)
+        cur_user = ""
+        if row:
+            cur_user = str(row[0])
+            _users[pid] = cur_user
+        current_user = cur_user
     return cur_user
 
 
-def get_columns_list(tablename, schemaname=None):
-    """ Return list of all columns in @tablename """
+def get_columns_list(tablename, schemaname=None, force=False):
+    """ Return list of all columns in @tablename
+        :return: List of (column_name, ) tuples ordered by position. Read the name with row[0]: rows are no longer
+                 DictRow, so row['column_name'] raises TypeError (list)
+    """
 
-    if schemaname in (None, 'null', ''):
-        schemaname = lib_vars.schema_name
+    schemaname = _get_schema_name(schemaname)
+    key = ('columns', schemaname, tablename)
+    columns = _get_cached_catalog(key, force)
+    if columns is _CACHE_MISS:
+        # Use the columns of the whole schema if they have been loaded (see prefetch_catalog and get_all_columns)
+        columns = _get_schema_columns(schemaname, force).get(tablename)
+    if not columns:
+        sql = ("SELECT column_name FROM information_schema.columns "
+               "WHERE table_schema = %s AND table_name = %s "
+               "ORDER BY ordinal_position")
+        params = [schemaname, tablename]
+        rows = get_rows(sql, params=params, prepare=True)
+        if not rows:
+            return rows
+        columns = _cache_catalog(key, [row[0] for row in rows])
+
+    # Same (column_name, ) rows whatever the source, in a new list so callers can't alter the cache
+    return [(column, ) for column in columns]
+
+
+def get_all_columns(schemaname=None, force=False):
+    """ Return the columns of every table and view of @schemaname in a single query
+        :return: Dictionary {table_name: [column names ordered by position]}
+    """
 
-    schemaname = schemaname.replace('"', '')
-    sql = ("SELECT column_name FROM information_schema.columns "
-           "WHERE table_schema = %s AND table_name = %s "
-           "ORDER BY ordinal_position")
-    params = [schemaname, tablename]
-    column_names = get_rows(sql, params=params)
-    return column_names
+    schemaname = _get_schema_name(schemaname)
+    key = ('all_columns', schemaname)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    sql = ("SELECT table_name, array_agg(column_name::text ORDER BY ordinal_position) "
+           "FROM information_schema.columns "
+           "WHERE table_schema = %s "
+           "GROUP BY table_name")
+    params = [schemaname]
+    rows = get_rows(sql, params=params)
+    columns = {row[0]: row[1] for row in rows or []}
+    return _cache_catalog(key, columns, ttl=_CATALOG_COLUMNS_TTL)
+
+
+def prefetch_catalog(schemaname=None):
+    """ Fill the catalog cache for @schemaname in a single query: schema existence, tables and their columns.
+    Later calls to check_schema, check_table and get_all_columns are served from the cache until execute_sql or
+    execute_returning clear it, so call it right before a batch of lookups """
+
+    schemaname = _get_schema_name(schemaname)
+    if not schemaname:
+        return False
+    sql = ("SELECT EXISTS (SELECT 1 FROM pg_namespace WHERE nspname = %s), "
+           "(SELECT array_agg(tablename::text) FROM pg_tables WHERE schemaname = %s), "
+           "(SELECT json_object_agg(table_name, columns) FROM "
+           "    (SELECT table_name, array_agg(column_name::text ORDER BY ordinal_position) AS columns "
+           "     FROM information_schema.columns WHERE table_schema = %s GROUP BY table_name) AS c)")
+    params = [schemaname, schemaname, schemaname]
+    row = get_row(sql, log_info=False, params=params)
+    if not row:
+        return False
+
+    schema_exists, tables, columns = row[0], row[1] or [], row[2] or {}
+    _cache_catalog(('schema', schemaname), (schemaname, ) if schema_exists else None)
+    for tablename in tables:
+        _cache_catalog(('table', schemaname, tablename), (schemaname, tablename))
+    _cache_catalog(('all_columns', schemaname), columns, ttl=_CATALOG_COLUMNS_TTL)
+    return True
 
 
-def get_srid(tablename, schemaname=None):
+def get_srid(tablename, schemaname=None, force=False):
     """ Find SRID of selected @tablename """
 
-    if schemaname in (None, 'null', ''):
-        schemaname = lib_vars.schema_name
+    schemaname = _get_schema_name(schemaname)
+    key = ('srid', schemaname, tablename)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
 
-    schemaname = schemaname.replace('"', '')
     srid = None
     sql = "SELECT Find_SRID(%s, %s, 'the_geom');"
     params = [schemaname, tablename]
-    row = get_row(sql, params=params)
+    row = get_row(sql, params=params, prepare=True)
     if row:
         srid = row[0]
 
-    return srid
+    return _cache_catalog(key, srid)
+
+
+def get_table_meta(tablename, schemaname=None, force=False):
+    """ Get columns, SRID and geometry type of @tablename in a single query
+        :return: Dictionary {'columns': [column names], 'srid': int, 'geom_type': str}, or None if not found
+    """
+
+    schemaname = _get_schema_name(schemaname)
+    key = ('meta', schemaname, tablename)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
+
+    sql = ("SELECT (SELECT array_agg(column_name::text ORDER BY ordinal_position) "
+           "        FROM information_schema.columns WHERE table_schema = %s AND table_name = %s), "
+           "g.srid, g.type "
+           "FROM (SELECT 1) AS t "
+           "LEFT JOIN geometry_columns AS g "
+           "ON g.f_table_schema = %s AND g.f_table_name = %s AND g.f_geometry_column = 'the_geom'")
+    params = [schemaname, tablename, schemaname, tablename]
+    row = get_row(sql, log_info=False, params=params)
+    if not row or row[0] is None:
+        return None
+
+    meta = {'columns': row[0], 'srid': row[1], 'geom_type': row[2]}
+    _cache_catalog(('srid', schemaname, tablename), meta['srid'])
+    return _cache_catalog(key, meta)
 
 
 def set_database_connection():
@@ -221,10 +384,18 @@ def set_database_connection():
 
     global dao
     global current_user
+    global _uri_template
     dao = None
+    reset_catalog_cache()
+    _server_info.clear()
+    _extensions.clear()
+    _prepared.clear()
+    _uri_template = None
     lib_vars.session_vars['last_error'] = None
     lib_vars.session_vars['logged_status'] = False
     current_user = None
+    with _users_lock:
+        _users.clear()
 
     layer_source, not_version = get_layer_source_from_credentials('prefer')
     if layer_source:
@@ -262,11 +433,15 @@ def check_db_connection():
 def get_pg_version():
     """ Get PostgreSQL version (integer value) """
 
-    pg_version = None
+    pg_version = _server_info.get('pg_version')
+    if pg_version:
+        return pg_version
+
     sql = "SELECT current_setting('server_version_num');"
     row = get_row(sql)
     if row:
         pg_version = row[0]
+        _server_info['pg_version'] = pg_version
 
     return pg_version
 
@@ -284,6 +459,8 @@ def connect_to_database(host, port, db, user, pwd, sslmode):
 
     # Update current user
     current_user = user
+    reset_catalog_cache()
+    _prepared.clear()
 
     # QSqlDatabase connection for Table Views
     status = create_qsqldatabase_connection(host, port, db, user, pwd)
@@ -302,6 +479,8 @@ def connect_to_database(host, port, db, user, pwd, sslmode):
         tools_log.log_warning(str(dao.last_error))
         return False
 
+    _bootstrap_server_info()
+
     return status
 
 
@@ -334,6 +513,7 @@ def reset_qsqldatabase_connection(dialog=iface):
     user = lib_vars.last_db_credentials['user']
     pwd = lib_vars.last_db_credentials['pwd']
     QSqlDatabase.removeDatabase(lib_vars.plugin_name)
+    reset_catalog_cache()
     create_qsqldatabase_connection(host, port, db, user, pwd)
     tools_qgis.show_warning("Database connection reset, please try again", dialog=dialog)
 
@@ -343,6 +523,8 @@ def connect_to_database_service(service, sslmode=None, conn_info=None):
     This service must exist in file pg_service.conf """
 
     global dao
+    reset_catalog_cache()
+    _prepared.clear()
     conn_string = f"service='{service}'"
     if sslmode:
         conn_string += f" sslmode={sslmode}"
@@ -385,13 +567,18 @@ def connect_to_database_service(service, sslmode=None, conn_info=None):
             tools_log.log_warning(str(dao.last_error))
             return False, credentials
 
+        _bootstrap_server_info()
+
     return status, credentials
 
 
 def get_postgis_version():
     """ Get Postgis version (integer value) """
 
-    postgis_version = None
+    postgis_version = _server_info.get('postgis')
+    if postgis_version:
+        return postgis_version
+
     postgis_extension = check_pg_extension('postgis')
 
     if postgis_extension:
@@ -399,6 +586,7 @@ def get_postgis_version():
         row = get_row(sql)
         if row:
             postgis_version = row[0]
+            _server_info['postgis'] = postgis_version
 
     return postgis_version
 
@@ -406,7 +594,10 @@ def get_postgis_version():
 def get_pgrouting_version():
     """ Get pgRouting version (integer value) """
 
-    pgrouting_version = None
+    pgrouting_version = _server_info.get('pgrouting')
+    if pgrouting_version:
+        return pgrouting_version
+
     pgrouting_extension = check_pg_extension('pgrouting')
 
     if pgrouting_extension:
@@ -414,59 +605,96 @@ def get_pgrouting_version():
         row = get_row(sql)
         if row:
             pgrouting_version = row[0]
+            _server_info['pgrouting'] = pgrouting_version
 
     return pgrouting_version
 
 
-
-def get_row(sql, log_info=True, log_sql=False, commit=True, params=None, aux_conn=None, is_admin=None, is_thread=False):
-    """ Execute SQL. Check its result in log tables, and show it to the user """
+def get_row(sql, log_info=True, log_sql=False, commit=True, params=None, aux_conn=None, is_admin=None, is_thread=False,
+            prepare=False):
+    """ Execute SQL. Check its result in log tables, and show it to the user
+    If @prepare is True, @sql is executed as a server-side prepared statement (only without @aux_conn) """
 
     global dao
     if dao is None:
         tools_log.log_warning("The connection to the database is broken.", parameter=sql)
         return None
-    sql = _get_sql(sql, log_sql, params)
-    row = dao.get_row(sql, commit, aux_conn=aux_conn)
+    if log_sql:
+        tools_log.log_db(_format_sql(sql, params), bold='b', stack_level_increase=1)
+    row = _execute_prepared(dao.get_row, sql, commit, aux_conn, params, prepare)
     lib_vars.session_vars['last_error'] = dao.last_error
 
     if not row and not is_admin:
         # Check if any error has been raised
         if lib_vars.session_vars['last_error'] and not is_thread:
-            tools_qt.manage_exception_db(lib_vars.session_vars['last_error'], sql)
-        elif lib_vars.session_vars['last_error'] is None and log_info:
-            tools_log.log_info("Any record found", parameter=sql, stack_level_increase=1)
+            tools_qt.manage_exception_db(lib_vars.session_vars['last_error'], _format_sql(sql, params))
+        elif lib_vars.session_vars['last_error'] is None and log_info and tools_log.is_info_enabled():
+            tools_log.log_info("Any record found", parameter=_format_sql(sql, params), stack_level_increase=1)
 
     return row
 
 
-def get_rows(sql, log_info=True, log_sql=False, commit=True, params=None, add_empty_row=False, is_thread=False, aux_conn=None):
-    """ Execute SQL. Check its result in log tables, and show it to the user """
+def get_rows(sql, log_info=True, log_sql=False, commit=True, params=None, add_empty_row=False, is_thread=False, aux_conn=None,
+             prepare=False):
+    """ Execute SQL. Check its result in log tables, and show it to the user
+    If @prepare is True, @sql is executed as a server-side prepared statement (only without @aux_conn) """
 
     global dao
     if dao is None:
         tools_log.log_warning("The connection to the database is broken.", parameter=sql)
         return None
-    sql = _get_sql(sql, log_sql, params)
+    if log_sql:
+        tools_log.log_db(_format_sql(sql, params), bold='b', stack_level_increase=1)
     rows = None
-    rows2 = dao.get_rows(sql, commit, aux_conn=aux_conn)
+    rows2 = _execute_prepared(dao.get_rows, sql, commit, aux_conn, params, prepare)
     lib_vars.session_vars['last_error'] = dao.last_error
     if not rows2:
         # Check if any error has been raised
         if lib_vars.session_vars['last_error'] and not is_thread:
-            tools_qt.manage_exception_db(lib_vars.session_vars['last_error'], sql)
-        elif lib_vars.session_vars['last_error'] is None and log_info:
-            tools_log.log_info("Any record found", parameter=sql, stack_level_increase=1)
+            tools_qt.manage_exception_db(lib_vars.session_vars['last_error'], _format_sql(sql, params))
+        elif lib_vars.session_vars['last_error'] is None and log_info and tools_log.is_info_enabled():
+            tools_log.log_info("Any record found", parameter=_format_sql(sql, params), stack_level_increase=1)
     else:
         if add_empty_row:
-            rows = [('', '')]
-            rows.extend(rows2)
-        else:
-            rows = rows2
+            # rows2 is a fresh list from fetchall(): prepend in place instead of copying it into a new list
+            rows2.insert(0, ('', ''))
+        rows = rows2
 
     return rows
 
 
+def get_query_columns(query):
+    """ Get the column names returned by @query without fetching its rows """
+
+    global dao
+    if dao is None:
+        tools_log.log_warning("The connection to the database is broken.", parameter=query)
+        return None
+    sql = f"SELECT * FROM ({query}) AS query_table LIMIT 0"
+    columns = dao.get_column_names(sql)
+    lib_vars.session_vars['last_error'] = dao.last_error
+    if columns is None:
+        tools_log.log_warning(str(dao.last_error), parameter=sql)
+
+    return columns
+
+
+def get_rows_iter(sql, log_sql=False, commit=True, params=None, itersize=2000, is_thread=False):
+    """ Execute SQL and yield its rows, fetched from the server in blocks of @itersize.
+    Useful for big result sets that are consumed only once """
+
+    global dao
+    if dao is None:
+        tools_log.log_warning("The connection to the database is broken.", parameter=sql)
+        return
+    if log_sql:
+        tools_log.log_db(_format_sql(sql, params), bold='b', stack_level_increase=1)
+    yield from dao.get_rows_iter(sql, itersize, commit, params=params)
+    lib_vars.session_vars['last_error'] = dao.last_error
+    if lib_vars.session_vars['last_error'] and not is_thread:
+        tools_qt.manage_exception_db(lib_vars.session_vars['last_error'], _format_sql(sql, params))
+
+
 def execute_sql(sql, log_sql=False, log_error=False, commit=True, filepath=None, is_thread=False, show_exception=True, aux_conn=None):
     """ Execute SQL. Check its result in log tables, and show it to the user """
 
@@ -476,12 +704,14 @@ def execute_sql(sql, log_sql=False, log_error=False, commit=True, filepath=None,
     result = dao.execute_sql(sql, commit, aux_conn=aux_conn)
     lib_vars.session_vars['last_error'] = dao.last_error
     if not result:
-        if log_error:
+        if log_error and tools_log.is_info_enabled():
             tools_log.log_info(sql, stack_level_increase=1)
         if show_exception and not is_thread:
             tools_qt.manage_exception_db(lib_vars.session_vars['last_error'], sql, filepath=filepath)
         return False
 
+    # @sql may have created or dropped database objects
+    reset_catalog_cache()
     return True
 
 
@@ -500,12 +730,14 @@ def execute_returning(sql, log_sql=False, log_error=False, commit=True, is_threa
     value = dao.execute_returning(sql, commit)
     lib_vars.session_vars['last_error'] = dao.last_error
     if not value:
-        if log_error:
+        if log_error and tools_log.is_info_enabled():
             tools_log.log_info(sql, stack_level_increase=1)
         if show_exception and not is_thread:
             tools_qt.manage_exception_db(lib_vars.session_vars['last_error'], sql)
         return False
 
+    # @sql may have created or dropped database objects
+    reset_catalog_cache()
     return value
 
 
@@ -513,24 +745,36 @@ def set_search_path(schema_name):
     """ Set parameter search_path for current QGIS project """
 
     global dao
+    schema_name = dao.quote_ident(schema_name.replace('"', ''))
     sql = f"SET search_path = {schema_name}, public;"
     execute_sql(sql)
     dao.set_search_path = sql
 
 
-def check_function(function_name, schema_name=None, commit=True, aux_conn=None, is_thread=False):
+def reset_catalog_cache():
+    """ Forget cached catalog lookups (check_schema, check_table, get_columns_list...).
+    Called by execute_sql and execute_returning. Call it after running DDL by other means """
+
+    _catalog_cache.clear()
+    _extensions.clear()
+
+
+def check_function(function_name, schema_name=None, commit=True, aux_conn=None, is_thread=False, force=False):
     """ Check if @function_name exists in selected schema """
 
-    if schema_name is None:
-        schema_name = lib_vars.schema_name
+    schema_name = _get_schema_name(schema_name)
+    key = ('function', schema_name, function_name)
+    cached = _get_cached_catalog(key, force)
+    if cached is not _CACHE_MISS:
+        return cached
 
-    schema_name = schema_name.replace('"', '')
-    sql = (f"SELECT routine_name "
-           f"FROM information_schema.routines "
-           f"WHERE lower(routine_schema) = '{schema_name}' "
-           f"AND lower(routine_name) = '{function_name}'")
-    row = get_row(sql, commit=commit, aux_conn=aux_conn, is_thread=is_thread)
-    return row
+    sql = ("SELECT p.proname "
+           "FROM pg_proc AS p JOIN pg_namespace AS n ON n.oid = p.pronamespace "
+           "WHERE lower(n.nspname) = %s "
+           "AND lower(p.proname) = %s LIMIT 1")
+    params = [schema_name, function_name]
+    row = get_row(sql, commit=commit, params=params, aux_conn=aux_conn, is_thread=is_thread, prepare=True)
+    return _cache_catalog(key, row)
 
 
 def connect_to_database_credentials(credentials, conn_info=None, max_attempts=2):
@@ -561,8 +805,15 @@ def get_layer_source_from_credentials(sslmode_default, layer_name='v_edit_node')
     sslmode_default should be (disable, allow, prefer, require, verify-ca, verify-full)"""
 
     global dao_db_credentials
-    # Get layer @layer_name
-    layer = tools_qgis.get_layer_by_tablename(layer_name)
+    # Get layer @layer_name. Reuse the one found in previous calls while it is still loaded in the project
+    key = (layer_name, lib_vars.project_vars['main_schema'])
+    layer = None
+    if key in _credentials_layer_ids:
+        layer = QgsProject.instance().mapLayer(_credentials_layer_ids[key])
+    if layer is None:
+        layer = tools_qgis.get_layer_by_tablename(layer_name)
+        if layer is not None:
+            _credentials_layer_ids[key] = layer.id()
 
     # Get database connection settings
     settings = QSettings()
@@ -582,31 +833,19 @@ def get_layer_source_from_credentials(sslmode_default, layer_name='v_edit_node')
         credentials = tools_qgis.get_layer_source(layer)
 
         # If sslmode is not defined
-        sslmode = sslmode_default
         if not credentials['sslmode']:
-            # If service is defined: get sslmode from .pg_service file
             if credentials['service']:
-                tools_log.log_info(f"Getting sslmode from .pg_service file")
-                credentials_service = tools_os.manage_pg_service(credentials['service'])
-                sslmode = credentials_service['sslmode'] if credentials_service['sslmode'] else sslmode_default
+                credentials['sslmode'] = _resolve_sslmode(sslmode_default, service=credentials['service'])
             elif settings.value('selected'):
                 default_connection = settings.value('selected')
                 settings.endGroup()
                 settings.beginGroup(f"PostgreSQL/connections/{default_connection}")
                 sslmode_settings = settings.value('sslmode')
                 settings.endGroup()
-                try:
-                    sslmode_dict = {
-                        0: 'prefer', 1: 'disable', 3: 'require',
-                        'SslPrefer': 'prefer', 'SslDisable': 'disable', 'SslRequire': 'require', 'SslAllow': 'allow'
-                    }
-                    sslmode = sslmode_dict.get(sslmode_settings, sslmode_default)
-                except ValueError:
-                    sslmode = sslmode_settings
-                credentials['sslmode'] = sslmode
+                credentials['sslmode'] = _resolve_sslmode(sslmode_default, sslmode_settings=sslmode_settings)
 
         lib_vars.schema_name = credentials['schema']
-        conn_info = QgsDataSourceUri(layer.dataProvider().dataSourceUri()).connectionInfo()
+        conn_info = _get_layer_conn_info(layer)
         status, credentials = connect_to_database_credentials(credentials, conn_info)
         if not status:
             tools_log.log_warning("Error connecting to database (layer)")
@@ -625,33 +864,21 @@ def get_layer_source_from_credentials(sslmode_default, layer_name='v_edit_node')
                        'host': None, 'port': None, 'user': None, 'password': None, 'sslmode': None}
 
         if default_connection:
+            # Read all the connection settings at once
             settings.beginGroup(f"PostgreSQL/connections/{default_connection}")
-            credentials['host'] = settings.value('host')
-            if settings.value('host') in (None, ""):
-                credentials['host'] = 'localhost'
-            credentials['port'] = settings.value('port')
-            credentials['db'] = settings.value('database')
-            credentials['user'] = settings.value('username')
-            credentials['password'] = settings.value('password')
-            credentials['service'] = settings.value('service')
-
-            sslmode_settings = settings.value('sslmode')
-            # If service is defined: get sslmode from .pg_service file
-            if credentials['service']:
-                tools_log.log_info(f"Getting sslmode from .pg_service file")
-                credentials_service = tools_os.manage_pg_service(credentials['service'])
-                sslmode = credentials_service['sslmode'] if credentials_service['sslmode'] else sslmode_default
-            try:
-                sslmode_dict = {
-                    0: 'prefer', 1: 'disable', 3: 'require',
-                    'SslPrefer': 'prefer', 'SslDisable': 'disable', 'SslRequire': 'require', 'SslAllow': 'allow'
-                }
-                sslmode = sslmode_dict.get(sslmode_settings, sslmode_default)
-            except ValueError:
-                sslmode = sslmode_settings
-            credentials['sslmode'] = sslmode
+            connection_settings = {key: settings.value(key) for key in settings.childKeys()}
             settings.endGroup()
 
+            credentials['host'] = connection_settings.get('host') or 'localhost'
+            credentials['port'] = connection_settings.get('port')
+            credentials['db'] = connection_settings.get('database')
+            credentials['user'] = connection_settings.get('username')
+            credentials['password'] = connection_settings.get('password')
+            credentials['service'] = connection_settings.get('service')
+
+            credentials['sslmode'] = _resolve_sslmode(sslmode_default, credentials['service'],
+                                                      connection_settings.get('sslmode'))
+
             status, credentials = connect_to_database_credentials(credentials, max_attempts=0)
             if not status:
                 tools_log.log_warning("Error connecting to database (settings)")
@@ -674,19 +901,18 @@ def get_uri():
     """
 
     global dao_db_credentials
+    global _uri_template, _uri_template_key
+
+    # Reuse the template while credentials stay the same. Callers get a copy, as they set the data source on it
+    key = tuple(dao_db_credentials.get(name) for name in ('service', 'host', 'port', 'db', 'user', 'password', 'sslmode'))
+    key += (lib_vars.project_vars['store_credentials'], )
+    if _uri_template is not None and key == _uri_template_key:
+        return QgsDataSourceUri(_uri_template)
+
     uri = QgsDataSourceUri()
     sslmode_default = QgsDataSourceUri.SslMode.SslPrefer
     sslmode_creds: str = dao_db_credentials['sslmode']
-    try:
-        sslmode_dict = {
-            'prefer': QgsDataSourceUri.SslMode.SslPrefer,
-            'disable': QgsDataSourceUri.SslMode.SslDisable,
-            'require': QgsDataSourceUri.SslMode.SslRequire,
-            'allow': QgsDataSourceUri.SslMode.SslAllow
-        }
-        sslmode = sslmode_dict.get(sslmode_creds, sslmode_default)
-    except ValueError:
-        sslmode = sslmode_default
+    sslmode = _SSLMODE_URI_DICT.get(sslmode_creds, sslmode_default)
     if dao_db_credentials['service']:
         uri.setConnection(dao_db_credentials['service'],
             dao_db_credentials['db'], dao_db_credentials['user'],
@@ -700,19 +926,204 @@ def get_uri():
             uri.setConnection(dao_db_credentials['host'], dao_db_credentials['port'],
                               dao_db_credentials['db'], '', '', sslmode)
 
-    return uri
+    _uri_template = uri
+    _uri_template_key = key
+    return QgsDataSourceUri(uri)
 
 # region private functions
 
 
-def _get_sql(sql, log_sql=False, params=None):
-    """ Generate SQL with params. Useful for debugging """
+def _bootstrap_server_info():
+    """ Get current user, PostgreSQL version and installed extensions in a single query """
+
+    global current_user
+    _server_info.clear()
+    _extensions.clear()
+    sql = ("SELECT current_user, current_setting('server_version_num'), "
+           "EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'postgis'), "
+           "EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pgrouting')")
+    row = get_row(sql, log_info=False)
+    if not row:
+        return
+
+    _server_info['pg_version'] = row[1]
+    # Only whether they are installed, versions come from postgis_lib_version() and pgr_version()
+    _server_info['extensions'] = {name for name, installed in (('postgis', row[2]), ('pgrouting', row[3])) if installed}
+    with _users_lock:
+        _users[dao.pid] = str(row[0])
+        current_user = _users[dao.pid]
+
+
+def _check_pg_extension(extension, form_enabled):
+    """ Check if @extension is installed, creating it if available and @form_enabled """
+
+    sql = "SELECT extname FROM pg_extension WHERE extname = %s"
+    params = [extension]
+    row = get_row(sql, params=params, prepare=True)
+
+    if not row:
+        sql = "SELECT name FROM pg_available_extensions WHERE name = %s"
+        row = get_row(sql, params=params, prepare=True)
+        if row and form_enabled:
+            sql = f"CREATE EXTENSION IF NOT EXISTS {dao.quote_ident(extension)};"
+            execute_sql(sql)
+
+            if extension == 'postgis':
+                postgis_version = get_postgis_version()
+                # Check postGis version
+                major_version = postgis_version.split(".")
+                if int(major_version[0]) >= 3:
+                    sql = f"CREATE EXTENSION IF NOT EXISTS postgis_raster;"
+                    execute_sql(sql)
+            return True, None
+        elif form_enabled:
+            message = f"Unable to create '{extension}' extension. Packages must be installed, consult your administrator."
+            return False, message
+
+    return True, None
+
+
+def _get_schema_name(schemaname):
+    """ Return @schemaname without quotes, or the current schema (lib_vars.schema_name) if not defined """
+
+    if schemaname in (None, 'null', ''):
+        schemaname = lib_vars.schema_name
+    return (schemaname or '').translate(_QUOTES_TABLE)
+
+
+def _get_layer_conn_info(layer):
+    """ Get connection info of @layer data source, parsing its uri only once while the source does not change """
+
+    global _conn_info_connected
+    layer_id = layer.id()
+    conn_info = _conn_info_cache.get(layer_id)
+    if conn_info is None:
+        if not _conn_info_connected:
+            QgsProject.instance().layersRemoved.connect(_forget_layers_conn_info)
+            _conn_info_connected = True
+        if layer_id not in _conn_info_layer_ids:
+            layer.dataSourceChanged.connect(lambda: _conn_info_cache.pop(layer_id, None))
+            _conn_info_layer_ids.add(layer_id)
+        conn_info = QgsDataSourceUri(layer.dataProvider().dataSourceUri()).connectionInfo()
+        _conn_info_cache[layer_id] = conn_info
+    return conn_info
+
+
+def _forget_layers_conn_info(layer_ids):
+    """ Drop the cached connection info of removed layers """
+
+    for layer_id in layer_ids:
+        _conn_info_cache.pop(layer_id, None)
+        _conn_info_layer_ids.discard(layer_id)
+
+
+def _resolve_sslmode(sslmode_default, service=None, sslmode_settings=None):
+    """ Get sslmode from .pg_service file if @service is defined, otherwise from QGIS connection settings """
+
+    if service:
+        tools_log.log_info("Getting sslmode from .pg_service file")
+        credentials_service = tools_os.manage_pg_service(service)
+        return credentials_service['sslmode'] or sslmode_default
+
+    return _SSLMODE_SETTINGS_DICT.get(sslmode_settings, sslmode_default)
+
+
+def _execute_prepared(dao_function, sql, commit, aux_conn, params, prepare):
+    """ Call @dao_function with @sql, as a server-side prepared statement if @prepare is True.
+    If the prepared statement no longer exists in the server, forget all of them and execute @sql again unprepared """
+
+    if not (prepare and params and aux_conn is None):
+        return dao_function(sql, commit, aux_conn=aux_conn, params=params)
+
+    exec_sql, exec_params = _get_prepared_sql(sql, params)
+    result = dao_function(exec_sql, commit, aux_conn=aux_conn, params=exec_params)
+    if exec_sql is not sql and getattr(dao.last_error, 'pgcode', None) == _INVALID_STATEMENT_NAME:
+        # Deallocated by DISCARD ALL/DEALLOCATE ALL, a connection pooler or a new backend with the same PID
+        _prepared.clear()
+        # Without @commit the failed EXECUTE has aborted the caller's transaction, so it can't be retried
+        if commit:
+            result = dao_function(sql, commit, aux_conn=aux_conn, params=params)
+    return result
+
+
+def _get_prepared_sql(sql, params):
+    """ Prepare @sql in the server once per backend and return the EXECUTE statement that replaces it.
+    It doesn't commit nor rollback the current transaction: PREPARE runs inside a savepoint """
+
+    global _prepared_pid
+    if _prepared_pid != dao.pid:
+        _prepared.clear()
+        _prepared_pid = dao.pid
+
+    name = _prepared.get(sql)
+    if name is False:
+        return sql, params
+    if name is None:
+        name = f"gw_stmt_{len(_prepared)}"
+        parts = sql.rstrip().rstrip(';').split('%s')
+        statement = parts[0] + ''.join(f"${i}{part}" for i, part in enumerate(parts[1:], 1))
+        # PREPARE is executed without parameters, so psycopg2 will not unescape '%%'
+        statement = statement.replace('%%', '%')
+        try:
+            cursor = dao.get_cursor()
+            cursor.execute("SAVEPOINT gw_prepare")
+        except Exception:
+            # Transaction already aborted: execute it without preparing, the caller will get the error
+            return sql, params
+        try:
+            cursor.execute(f"PREPARE {name} AS {statement}")
+            cursor.execute("RELEASE SAVEPOINT gw_prepare")
+        except Exception as e:
+            # Undo only the failed PREPARE and don't try it again
+            tools_log.log_warning(f"Unable to prepare statement: {e}", parameter=sql)
+            try:
+                cursor.execute("ROLLBACK TO SAVEPOINT gw_prepare")
+                cursor.execute("RELEASE SAVEPOINT gw_prepare")
+            except Exception:
+                pass
+            _prepared[sql] = False
+            return sql, params
+        _prepared[sql] = name
+
+    placeholders = ', '.join(['%s'] * len(params))
+    return f"EXECUTE {name} ({placeholders})", params
+
+
+def _get_cached_catalog(key, force=False):
+    """ Return the cached result of catalog lookup @key, or _CACHE_MISS if it is not cached or has expired """
+
+    if force:
+        return _CACHE_MISS
+    cached = _catalog_cache.get(key)
+    if cached is None or cached[0] < time.monotonic():
+        return _CACHE_MISS
+    return cached[1]
+
+
+def _get_schema_columns(schemaname, force=False):
+    """ Return the cached columns of every table of @schemaname, or an empty dictionary if not loaded """
+
+    columns = _get_cached_catalog(('all_columns', schemaname), force)
+    if columns is _CACHE_MISS or not columns:
+        return {}
+    return columns
+
+
+def _cache_catalog(key, value, ttl=_CATALOG_TTL):
+    """ Store @value in the catalog cache for @ttl seconds. Missing objects are not stored, so they are checked again
+    next time """
+
+    if value:
+        _catalog_cache[key] = (time.monotonic() + ttl, value)
+    return value
+
+
+def _format_sql(sql, params=None):
+    """ Return @sql with @params bound. Only used to show the query in logs and messages """
 
     global dao
     if params:
         sql = dao.mogrify(sql, params)
-    if log_sql:
-        tools_log.log_db(sql, bold='b', stack_level_increase=2)
 
     return sql
 
@@ -173,6 +173,15 @@ def set_logger(logger_name, min_log_level=20):
         lib_vars.logger.min_message_level = values.get(int(min_log_level), 0)
 
 
+def is_info_enabled():
+    """ Return True if info messages are written to QGIS Log Messages Panel or to the logger file """
+
+    logger = lib_vars.logger
+    if not logger:
+        return False
+    return logger.min_message_level <= 0 or logger.min_log_level <= logging.INFO
+
+
 def log_debug(text=None, context_name="giswater", parameter=None, logger_file=True, stack_level_increase=0, tab_name=None):
     """ Write debug message into QGIS Log Messages Panel """
 
@@ -5,7 +5,8 @@ The program is free software: you can redistribute it and/or modify it under the
 General Public License as published by the Free Software Foundation, either version 3 of the License,
 or (at your option) any later version.
 """
-import configparser
+import concurrent.futures
+import functools
 import os
 import pathlib
 import sys
@@ -13,31 +14,41 @@ import subprocess
 import urllib.parse as parse
 import webbrowser
 import re
-from chardet import detect
+from chardet.universaldetector import UniversalDetector
 
 from qgis.PyQt.QtWidgets import QFileDialog
 
 from . import tools_log
 
 
+_BOOL_VALUES = {'true': True, 'false': False}  # Lowercase strings recognized by set_boolean()
+_HOME = None
+_IS_WIN = sys.platform == "win32"
+_OPENER = "open" if sys.platform == "darwin" else "xdg-open"  # Used by open_file() if not _IS_WIN
+_DATADIR = {"win32": "AppData/Roaming", "linux": ".local/share",
+            "darwin": "Library/Application Support"}.get(sys.platform)  # Relative to home directory
+_SEP_TABLE = str.maketrans('\\', '/')
+_ENCODING_CHUNK_SIZE = 65536
+_SCAN_WORKERS = 8  # Threads used by get_number_of_files()
+_URL_SCHEMES = ('http://', 'https://', 'ftp://', 'file://')
+# Used by open_file() to check if a path is an URL
+_URL_RE = re.compile(r"""(?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?«»“”‘’])|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)\b/?(?!@)))""", re.IGNORECASE)
+
+
 def get_datadir() -> pathlib.Path:
     """
     Returns a parent directory path
     where persistent application data can be stored.
+    The home directory and the platform subfolder are only resolved once.
 
     # linux: ~/.local/share
     # macOS: ~/Library/Application Support
     # windows: C:/Users/<USER>/AppData/Roaming
     """
 
-    home = pathlib.Path.home()
-
-    if sys.platform == "win32":
-        return home / "AppData/Roaming"
-    elif sys.platform == "linux":
-        return home / ".local/share"
-    elif sys.platform == "darwin":
-        return home / "Library/Application Support"
+    if _DATADIR is None:
+        return None
+    return _home() / _DATADIR
 
 
 def open_file(file_path):
@@ -48,60 +59,80 @@ def open_file(file_path):
 
     try:
         # Open selected document
-        # Check if path is URL
-        url_regex = r"""(?i)\b((?:https?:(?:/{1,3}|[a-z0-9%])|[a-z0-9.\-]+[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)/)(?:[^\s()<>{}\[\]]+|\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\))+(?:\([^\s()]*?\([^\s()]+\)[^\s()]*?\)|\([^\s]+?\)|[^\s`!()\[\]{};:'".,<>?«»“”‘’])|(?:(?<!@)[a-z0-9]+(?:[.\-][a-z0-9]+)*[.](?:com|net|org|edu|gov|mil|aero|asia|biz|cat|coop|info|int|jobs|mobi|museum|name|post|pro|tel|travel|xxx|ac|ad|ae|af|ag|ai|al|am|an|ao|aq|ar|as|at|au|aw|ax|az|ba|bb|bd|be|bf|bg|bh|bi|bj|bm|bn|bo|br|bs|bt|bv|bw|by|bz|ca|cc|cd|cf|cg|ch|ci|ck|cl|cm|cn|co|cr|cs|cu|cv|cx|cy|cz|dd|de|dj|dk|dm|do|dz|ec|ee|eg|eh|er|es|et|eu|fi|fj|fk|fm|fo|fr|ga|gb|gd|ge|gf|gg|gh|gi|gl|gm|gn|gp|gq|gr|gs|gt|gu|gw|gy|hk|hm|hn|hr|ht|hu|id|ie|il|im|in|io|iq|ir|is|it|je|jm|jo|jp|ke|kg|kh|ki|km|kn|kp|kr|kw|ky|kz|la|lb|lc|li|lk|lr|ls|lt|lu|lv|ly|ma|mc|md|me|mg|mh|mk|ml|mm|mn|mo|mp|mq|mr|ms|mt|mu|mv|mw|mx|my|mz|na|nc|ne|nf|ng|ni|nl|no|np|nr|nu|nz|om|pa|pe|pf|pg|ph|pk|pl|pm|pn|pr|ps|pt|pw|py|qa|re|ro|rs|ru|rw|sa|sb|sc|sd|se|sg|sh|si|sj|Ja|sk|sl|sm|sn|so|sr|ss|st|su|sv|sx|sy|sz|tc|td|tf|tg|th|tj|tk|tl|tm|tn|to|tp|tr|tt|tv|tw|tz|ua|ug|uk|us|uy|uz|va|vc|ve|vg|vi|vn|vu|wf|ws|ye|yt|yu|za|zm|zw)\b/?(?!@)))"""
-        regex = re.compile(url_regex, re.IGNORECASE)
-        if re.match(regex, file_path) is not None:
+        # Check if path is URL. Most paths are local files, so only use the URL regex when it is neither
+        # an explicit URL nor an existing file
+        if file_path[:10].lower().startswith(_URL_SCHEMES):
             webbrowser.open(file_path)
-        else:
-            if not os.path.exists(file_path):
-                message = "File not found"
-                return False, message
+        elif os.path.exists(file_path):
+            if _IS_WIN:
+                os.startfile(file_path)
             else:
-                if sys.platform == "win32":
-                    os.startfile(file_path)
-                else:
-                    opener = "open" if sys.platform == "darwin" else "xdg-open"
-                    subprocess.call([opener, file_path])
+                subprocess.call([_OPENER, file_path])
+        elif _URL_RE.match(file_path) is not None:
+            webbrowser.open(file_path)
+        else:
+            message = "File not found"
+            return False, message
         return True, None
     except Exception:
         return False, None
 
 
 def get_encoding_type(file_path):
+    """ Detect the encoding of @file_path, reading it in chunks until the detector is confident """
+
+    detector = UniversalDetector()
     with open(file_path, 'rb') as f:
-        rawdata = f.read()
-    return detect(rawdata)['encoding']
+        for chunk in iter(functools.partial(f.read, _ENCODING_CHUNK_SIZE), b''):
+            detector.feed(chunk)
+            if detector.done:
+                break
+    detector.close()
+    return detector.result['encoding']
 
 
 def get_relative_path(filepath, levels=1):
+    """ Return the last @levels folders of @filepath followed by its file name """
 
-    common = filepath
-    for i in range(levels + 1):
-        common = os.path.dirname(common)
+    if not filepath:
+        return ''
 
-    return os.path.relpath(filepath, common)
+    parts = [part for part in filepath.translate(_SEP_TABLE).split('/') if part]
+    return os.sep.join(parts[-(levels + 1):])
 
 
 def get_values_from_dictionary(dictionary):
     """ Return values from @dictionary """
 
-    list_values = iter(dictionary.values())
-    return list_values
+    return iter(dictionary.values())
 
 
 def set_boolean(param, default=True):
     """
     Receives a string and returns a bool
         :param param: String to cast (String)
-        :param default: Value to return if the parameter is not one of the keys of the dictionary of values (Boolean)
-        :return: default if param not in bool_dict (bool)
+        :param default: Value to return if the parameter is not a recognized boolean value (Boolean)
+        :return: default if param is not a recognized boolean value (bool)
     """
 
-    bool_dict = {True: True, "TRUE": True, "True": True, "true": True,
-                 False: False, "FALSE": False, "False": False, "false": False}
+    if param is True or param is False:
+        return param
+    if isinstance(param, str):
+        return _BOOL_VALUES.get(param.lower(), default)
+    if param in (0, 1):
+        return bool(param)
 
-    return bool_dict.get(param, default)
+    return default
+
+
+def make_bool_coercer(default=True):
+    """
+    Returns a function that casts a value to bool like set_boolean, with @default fixed
+        :param default: Value to return if the parameter is not a recognized boolean value (Boolean)
+        :return: Function that receives the parameter to cast (function)
+    """
+
+    return functools.partial(set_boolean, default=default)
 
 
 def open_file_path(msg="Select file", filter_="All (*.*)"):
@@ -114,8 +145,7 @@ def open_file_path(msg="Select file", filter_="All (*.*)"):
 def check_python_function(module, function_name):
     """ Check if function exist in @module """
 
-    object_functions = [method_name for method_name in dir(module) if callable(getattr(module, method_name))]
-    return function_name in object_functions
+    return callable(getattr(module, function_name, None))
 
 
 def get_folder_size(folder):
@@ -124,13 +154,8 @@ def get_folder_size(folder):
     if not os.path.exists(folder):
         return 0
 
-    size = 0
-    for file in os.listdir(folder):
-        filepath = os.path.join(folder, file)
-        if os.path.isfile(filepath):
-            size += os.path.getsize(filepath)
-
-    return size
+    with os.scandir(folder) as entries:
+        return sum(entry.stat().st_size for entry in entries if entry.is_file())
 
 
 def get_number_of_files(folder):
@@ -139,14 +164,50 @@ def get_number_of_files(folder):
     if not os.path.exists(folder):
         return 0
 
-    file_count = sum(len(files) for _, _, files in os.walk(folder))
+    # Scan subfolders concurrently, so that the latency of each folder read (network drives, cold cache) overlaps
+    file_count = 0
+    with concurrent.futures.ThreadPoolExecutor(max_workers=_SCAN_WORKERS) as executor:
+        pending = {executor.submit(_scan_folder, folder)}
+        while pending:
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                count, subfolders = future.result()
+                file_count += count
+                pending.update(executor.submit(_scan_folder, subfolder) for subfolder in subfolders)
+
     return file_count
 
 
 def ireplace(old, new, text):
     """ Replaces @old by @new in @text (case-insensitive) """
 
-    return re.sub('(?i)'+re.escape(old), lambda m: new, text)
+    if not old:
+        return text
+
+    # Nothing to fold in digits or symbols
+    if old.lower() == old.upper():
+        return text.replace(old, new)
+
+    # Unicode case folding may change string lengths, so only ASCII can be scanned over a lowered copy
+    if not (old.isascii() and text.isascii()):
+        # Backslashes are escaped so that @new is used literally instead of as a template
+        repl = new.replace('\\', r'\\') if '\\' in new else new
+        return _compile_ci(old).sub(repl, text)
+
+    needle = old.lower()
+    haystack = text.lower()
+    size = len(needle)
+    parts = []
+    i = 0
+    while True:
+        j = haystack.find(needle, i)
+        if j < 0:
+            parts.append(text[i:])
+            break
+        parts.append(text[i:j])
+        parts.append(new)
+        i = j + size
+    return ''.join(parts)
 
 
 def manage_pg_service(section):
@@ -154,15 +215,12 @@ def manage_pg_service(section):
     credentials = {'host': None, 'port': None, 'dbname': None, 'user': None, 'password': None, 'sslmode': None}
 
     pgservice_file = os.environ.get('PGSERVICEFILE')
-    sysconf_dir = f"{os.environ.get('PGSYSCONFDIR')}{os.sep}pg_service.conf"
-
-    if not any([pgservice_file, sysconf_dir]):
+    pgsysconf_dir = os.environ.get('PGSYSCONFDIR')
+    if not (pgservice_file or pgsysconf_dir):
         return credentials
 
-    invalid_service_files = {path: not (bool(value) and os.path.exists(value))
-                             for path, value in {"PGSERVICEFILE": pgservice_file, "PGSYSCONFDIR": sysconf_dir}.items()}
-
-    if all(invalid_service_files.values()):
+    sysconf_dir = os.path.join(pgsysconf_dir, 'pg_service.conf') if pgsysconf_dir else None
+    if not (pgservice_file and os.path.exists(pgservice_file)) and not (sysconf_dir and os.path.exists(sysconf_dir)):
         tools_log.log_warning(f"Files defined in environment variables 'PGSERVICEFILE' and 'PGSYSCONFDIR' not found.")
         return credentials
 
@@ -180,18 +238,82 @@ def manage_pg_service(section):
 def get_credentials_from_config(section, config_file) -> dict:
     credentials = {'host': None, 'port': None, 'dbname': None, 'user': None, 'password': None, 'sslmode': None}
     try:
-        with open(config_file, 'r') as file:
-            config_parser = configparser.ConfigParser(comment_prefixes=";", allow_no_value=True, strict=False)
-            config_parser.read_file(file)
-            if config_parser.has_section(section):
-                params = config_parser.items(section)
-                if not params:
-                    tools_log.log_warning(f"No parameters found in section {section}")
-                    return credentials
-                for param in params:
-                    credentials[param[0]] = param[1]
-    except (configparser.DuplicateSectionError, FileNotFoundError) as e:
+        # Parse the file again only if it has been modified
+        sections = _parse_config_file(config_file, os.stat(config_file).st_mtime_ns)
+        if section in sections:
+            params = sections[section]
+            if not params:
+                tools_log.log_warning(f"No parameters found in section {section}")
+                return credentials
+            credentials.update(params)
+    except FileNotFoundError as e:
         tools_log.log_warning(e)
     except TypeError:
         pass
     return credentials
+
+
+# region private functions
+
+
+def _home():
+    """ Return the user home directory, resolving it only once """
+
+    global _HOME
+    if _HOME is None:
+        _HOME = pathlib.Path.home()
+    return _HOME
+
+
+@functools.lru_cache(maxsize=16)
+def _parse_config_file(config_file, mtime):
+    """ Return the sections of @config_file as {section: {key: value}}. Cached by file path and modification time """
+
+    # pg_service.conf is just '[section]' headers followed by 'key=value' lines, no need for configparser
+    sections = {}
+    params = None
+    with open(config_file, 'r') as file:
+        for line in file:
+            line = line.strip()
+            if not line or line[0] in '#;':
+                continue
+            if line[0] == '[' and line[-1] == ']':
+                params = sections.setdefault(line[1:-1].strip(), {})
+            elif params is not None:
+                key, sep, value = line.partition('=')
+                params[key.strip().lower()] = value.strip() if sep else None
+    return sections
+
+
+def _scan_folder(folder):
+    """ Return the number of files of @folder and the list of its subfolders.
+    Same as os.walk: symlinks to folders are counted as folders but not followed """
+
+    file_count = 0
+    subfolders = []
+    try:
+        entries = os.scandir(folder)
+    except OSError:
+        return file_count, subfolders
+
+    with entries:
+        for entry in entries:
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if not is_dir:
+                file_count += 1
+            elif not entry.is_symlink():
+                subfolders.append(entry.path)
+
+    return file_count, subfolders
+
+
+@functools.lru_cache(maxsize=512)
+def _compile_ci(pattern):
+    """ Compile @pattern as a literal, case-insensitive regex (cached) """
+    return re.compile(re.escape(pattern), re.IGNORECASE)
+
+
+# endregion
@@ -5,12 +5,21 @@ General Public License as published by the Free Software Foundation, either vers
 or (at your option) any later version.
 """
 # -*- coding: utf-8 -*-
+import itertools
+
 import psycopg2
+import psycopg2.extensions
 import psycopg2.extras
+import psycopg2.pool
 
 
 class GwPgDao(object):
 
+    _stream_ids = itertools.count()
+
+    # TCP keepalive parameters (libpq) so idle connections survive firewalls and dead peers are detected
+    keepalive_params = {'keepalives': 1, 'keepalives_idle': 30, 'keepalives_interval': 10, 'keepalives_count': 3}
+
     def __init__(self):
 
         self.last_error = None
@@ -18,13 +27,15 @@ class GwPgDao(object):
         self.conn = None
         self.cursor = None
         self.pid = None
+        self.pool = None
+        self.max_aux_conns = 10
 
 
     def init_db(self):
         """ Initializes database connection """
 
         try:
-            self.conn = psycopg2.connect(self.conn_string)
+            self.conn = psycopg2.connect(self.conn_string, **self.keepalive_params)
             self.cursor = self.get_cursor()
             self.pid = self.conn.get_backend_pid()
             status = True
@@ -44,6 +55,9 @@ class GwPgDao(object):
                 self.cursor.close()
             if self.conn:
                 self.conn.close()
+            if self.pool:
+                self.pool.closeall()
+                self.pool = None
             del self.cursor
             del self.conn
         except Exception as e:
@@ -81,11 +95,11 @@ class GwPgDao(object):
         return status
 
 
-    def cursor_execute(self, sql):
+    def cursor_execute(self, sql, params=None):
         """ Check if cursor is closed before execution """
 
         if self.check_cursor():
-            self.cursor.execute(sql)
+            self.cursor.execute(sql, params or None)
 
 
     def get_poll(self):
@@ -145,14 +159,20 @@ class GwPgDao(object):
             return query
 
 
-    def get_rows(self, sql, commit=False, aux_conn=None):
+    def quote_ident(self, name):
+        """ Return @name quoted as an SQL identifier """
+
+        return psycopg2.extensions.quote_ident(name, self.conn)
+
+
+    def get_rows(self, sql, commit=False, aux_conn=None, params=None):
         """ Get multiple rows from selected query """
 
         self.last_error = None
         rows = None
         try:
             cursor = self.get_cursor(aux_conn)
-            cursor.execute(sql)
+            cursor.execute(sql, params or None)
             rows = cursor.fetchall()
             if commit:
                 self.commit(aux_conn)
@@ -164,7 +184,59 @@ class GwPgDao(object):
             return rows
 
 
-    def get_row(self, sql, commit=False, aux_conn=None):
+    def get_column_names(self, sql, params=None):
+        """ Get the column names returned by selected query (fetch no rows, use LIMIT 0).
+        It runs inside a savepoint with the default search_path, as a new connection would, and undoes it afterwards.
+        The current transaction is neither committed nor rolled back """
+
+        self.last_error = None
+        columns = None
+        try:
+            in_transaction = self.conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE
+            cursor = self.get_cursor()
+            cursor.execute("SAVEPOINT gw_column_names")
+            try:
+                cursor.execute("SET LOCAL search_path TO DEFAULT")
+                cursor.execute(sql, params or None)
+                columns = [column.name for column in cursor.description]
+            finally:
+                cursor.execute("ROLLBACK TO SAVEPOINT gw_column_names")
+                cursor.execute("RELEASE SAVEPOINT gw_column_names")
+                if not in_transaction:
+                    # The savepoint opened the transaction, end it
+                    self.rollback()
+        except Exception as e:
+            self.last_error = e
+        finally:
+            return columns
+
+
+    def get_rows_iter(self, sql, itersize=2000, commit=False, params=None):
+        """ Iterate over the rows of selected query, fetching them in blocks of @itersize (server-side cursor) """
+
+        self.last_error = None
+        cursor = None
+        try:
+            cursor = self.conn.cursor(f"gw_stream_{next(self._stream_ids)}", cursor_factory=psycopg2.extras.DictCursor)
+            cursor.itersize = itersize
+            cursor.execute(sql, params or None)
+            yield from cursor
+            cursor.close()
+            if commit:
+                self.commit()
+        except Exception as e:
+            self.last_error = e
+            if commit:
+                self.rollback()
+        finally:
+            try:
+                if cursor is not None and not cursor.closed:
+                    cursor.close()
+            except Exception:
+                pass
+
+
+    def get_row(self, sql, commit=False, aux_conn=None, params=None):
         """ Get single row from selected query """
 
         self.last_error = None
@@ -172,10 +244,10 @@ class GwPgDao(object):
         try:
             if aux_conn is not None:
                 cursor = self.get_cursor(aux_conn)
-                cursor.execute(sql)
+                cursor.execute(sql, params or None)
                 row = cursor.fetchone()
             else:
-                self.cursor_execute(sql)
+                self.cursor_execute(sql, params)
                 row = self.cursor.fetchone()
             if commit:
                 self.commit(aux_conn)
@@ -265,7 +337,7 @@ class GwPgDao(object):
         # Create an auxiliary connection with the intention of being able to cancel processes of the main connection
         last_error = None
         try:
-            aux_conn = psycopg2.connect(self.conn_string)
+            aux_conn = psycopg2.connect(self.conn_string, **self.keepalive_params)
             cursor = self.get_cursor(aux_conn)
             cursor.execute(f"SELECT pg_cancel_backend({pid})")
             status = True
@@ -281,9 +353,20 @@ class GwPgDao(object):
 
 
     def get_aux_conn(self):
+        """ Get an auxiliary connection from the pool. Give it back with delete_aux_con """
 
         try:
-            aux_conn = psycopg2.connect(self.conn_string)
+            if self.pool is None or self.pool.closed:
+                self.pool = psycopg2.pool.ThreadedConnectionPool(1, self.max_aux_conns, self.conn_string,
+                                                                 **self.keepalive_params)
+            try:
+                aux_conn = self.pool.getconn()
+                if aux_conn.closed:
+                    self.pool.putconn(aux_conn, close=True)
+                    aux_conn = self.pool.getconn()
+            except psycopg2.pool.PoolError:
+                # Pool exhausted: use a connection outside of it, delete_aux_con will close it
+                aux_conn = psycopg2.connect(self.conn_string, **self.keepalive_params)
             cursor = self.get_cursor(aux_conn)
             if self.set_search_path:
                 cursor.execute(self.set_search_path)
@@ -296,9 +379,15 @@ class GwPgDao(object):
 
 
     def delete_aux_con(self, aux_conn):
+        """ Return @aux_conn to the pool (or close it if it does not belong to the pool) """
 
         try:
-            aux_conn.close()
+            # Don't hand temp tables, settings or roles of this session to the next user of the connection
+            discarded = self._discard_session_state(aux_conn)
+            try:
+                self.pool.putconn(aux_conn, close=not discarded)
+            except (AttributeError, psycopg2.pool.PoolError):
+                aux_conn.close()
             del aux_conn
             return
         except Exception as e:
@@ -307,6 +396,21 @@ class GwPgDao(object):
         return {'status': status, 'last_error': last_error}
 
 
+    def _discard_session_state(self, conn):
+        """ End the open transaction of @conn and reset its session state. Return False if it can't be reused """
+
+        if conn.closed:
+            return False
+        try:
+            conn.rollback()
+            conn.autocommit = True
+            conn.cursor().execute("DISCARD ALL")
+            conn.autocommit = False
+            return True
+        except psycopg2.Error:
+            return False
+
+
     def check_connection(self):
         """ Check database connection. Reconnect if needed """
 
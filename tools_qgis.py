@@ -7,7 +7,7 @@ or (at your option) any later version.
 # -*- coding: utf-8 -*-
 import configparser
 import re
-from functools import partial
+from functools import lru_cache, partial
 from typing import Optional
 
 import console
@@ -16,7 +16,7 @@ import shlex
 import sys
 from random import randrange
 
-from qgis.PyQt.QtCore import Qt, QTimer, QSettings
+from qgis.PyQt.QtCore import Qt, QTimer, QSettings, QThread
 from qgis.PyQt.QtGui import QColor
 from qgis.PyQt.QtWidgets import QDockWidget, QApplication, QPushButton, QDialog, QVBoxLayout, QTextEdit, QDialogButtonBox
 from qgis.core import QgsExpressionContextUtils, QgsProject, QgsPointLocator, \
@@ -41,7 +41,16 @@ MESSAGE_LEVEL_SUCCESS = 3 # Green
 DEFAULT_MESSAGE_DURATION = 10
 MINIMUM_WARNING_DURATION = 10
 
-def get_feature_by_expr(layer, expr_filter):
+_metadata_cache = {}        # Parsed metadata.txt files {path: (modification time, ConfigParser)}
+_plugin_name_index = {}     # Plugin folders by metadata name {name: [folder_name, ...]}. See _get_plugin_folders()
+_plugin_name_index_key = None   # available_plugins used to build _plugin_name_index
+_layer_index = None         # Project layers by table name {table: [(schema, layer), ...]} in TOC order. See _get_layer_index()
+_layer_index_connected = False
+_layer_index_layer_ids = set()  # Layers whose dataSourceChanged signal resets _layer_index
+_dev_duration = (None, None)    # User parameter 'show_message_durations' (value, value as int). See _get_dev_duration()
+_message_queue = []         # Messages waiting to be pushed to the message bar. See _queue_message()
+
+def get_feature_by_expr(layer, expr_filter, with_geometry=True):
 
     # Check filter and existence of fields
     expr = QgsExpression(expr_filter)
@@ -50,12 +59,13 @@ def get_feature_by_expr(layer, expr_filter):
         show_warning(message)
         return
 
-    it = layer.getFeatures(QgsFeatureRequest(expr))
-    # Iterate over features
-    for feature in it:
-        return feature
+    # Only the first feature is needed, let the provider stop there
+    request = QgsFeatureRequest(expr)
+    request.setLimit(1)
+    if not with_geometry:
+        request.setFlags(QgsFeatureRequest.NoGeometry)
 
-    return False
+    return next(iter(layer.getFeatures(request)), False)
 
 
 def show_message(text, message_level=MESSAGE_LEVEL_WARNING, duration=DEFAULT_MESSAGE_DURATION, context_name="giswater", parameter=None, title="", logger_file=True,
@@ -74,13 +84,13 @@ def show_message(text, message_level=MESSAGE_LEVEL_WARNING, duration=DEFAULT_MES
     global user_parameters
 
     # Get optional parameter 'show_message_durations'
-    dev_duration = user_parameters.get('show_message_durations')
+    dev_duration = _get_dev_duration()
     # If is set, use this value
-    if dev_duration not in (None, "None"):
-        if message_level in (MESSAGE_LEVEL_WARNING, MESSAGE_LEVEL_CRITICAL) and int(dev_duration) < MINIMUM_WARNING_DURATION:
+    if dev_duration is not None:
+        if message_level in (MESSAGE_LEVEL_WARNING, MESSAGE_LEVEL_CRITICAL) and dev_duration < MINIMUM_WARNING_DURATION:
             duration = DEFAULT_MESSAGE_DURATION
         else:
-            duration = int(dev_duration)
+            duration = dev_duration
     msg = None
     if text:
         msg = tools_qt.tr(text, context_name, user_parameters['aux_context'])
@@ -93,7 +103,7 @@ def show_message(text, message_level=MESSAGE_LEVEL_WARNING, duration=DEFAULT_MES
             # show message with button with the sqlcontext
             show_message_function(msg, lambda: show_sqlcontext_dialog(sqlcontext, msg, title, 500, 300), "Show more", message_level, duration, context_name, logger_file, dialog)
         else:
-            dialog.messageBar().pushMessage(title, msg, message_level, duration)
+            _queue_message(dialog, title, msg, message_level, duration)
     except Exception as e:  # This is because "messageBar().pushMessage" is only available for QMainWindow, not QDialog.
         print("Exception show_message: ", e)
         iface.messageBar().pushMessage(title, msg, message_level, duration)
@@ -119,13 +129,13 @@ def show_message_link(text, url, btn_text="Open", message_level=MESSAGE_LEVEL_IN
     global user_parameters
 
     # Get optional parameter 'show_message_durations'
-    dev_duration = user_parameters.get('show_message_durations')
+    dev_duration = _get_dev_duration()
     # If is set, use this value
-    if dev_duration not in (None, "None"):
-        if message_level in (1, 2) and int(dev_duration) < 10:
-            duration = 10
+    if dev_duration is not None:
+        if message_level in (MESSAGE_LEVEL_WARNING, MESSAGE_LEVEL_CRITICAL) and dev_duration < MINIMUM_WARNING_DURATION:
+            duration = DEFAULT_MESSAGE_DURATION
         else:
-            duration = int(dev_duration)
+            duration = dev_duration
     msg = None
     if text:
         msg = tools_qt.tr(text, context_name, user_parameters['aux_context'])
@@ -161,13 +171,13 @@ def show_message_function(text, function, btn_text="Open", message_level=MESSAGE
     global user_parameters
 
     # Get optional parameter 'show_message_durations'
-    dev_duration = user_parameters.get('show_message_durations')
+    dev_duration = _get_dev_duration()
     # If is set, use this value
-    if dev_duration not in (None, "None") and duration > 0:
-        if message_level in (MESSAGE_LEVEL_WARNING, MESSAGE_LEVEL_CRITICAL) and int(dev_duration) < MINIMUM_WARNING_DURATION:
+    if dev_duration is not None and duration > 0:
+        if message_level in (MESSAGE_LEVEL_WARNING, MESSAGE_LEVEL_CRITICAL) and dev_duration < MINIMUM_WARNING_DURATION:
             duration = DEFAULT_MESSAGE_DURATION
         else:
-            duration = int(dev_duration)
+            duration = dev_duration
     msg = None
     if text:
         msg = tools_qt.tr(text, context_name, user_parameters['aux_context'])
@@ -299,31 +309,18 @@ def get_visible_layers(as_str_list=False, as_list=False):
         xxxx, True --> return list like ['name1', 'name2', '...']
     """
 
-    layers_name = []
-    visible_layer = '{'
-    if as_str_list:
-        visible_layer = '['
-    layers = get_project_layers()
-    for layer in layers:
-        if not check_query_layer(layer):
-            continue
-        if is_layer_visible(layer):
-            table_name = get_layer_source_table_name(layer)
-            if not check_query_layer(layer):
-                continue
-            layers_name.append(table_name)
-            visible_layer += f'"{table_name}", '
-    visible_layer = visible_layer[:-2]
-
+    # Check visibility on the TOC nodes directly, instead of looking for the node of each layer
+    layer_nodes = QgsProject.instance().layerTreeRoot().findLayers()
+    layers = (node.layer() for node in layer_nodes if node.itemVisibilityChecked())
+    layers_name = [get_layer_source_table_name(layer) for layer in layers if check_query_layer(layer)]
     if as_list:
         return layers_name
 
+    visible_layer = ", ".join(f'"{table_name}"' for table_name in layers_name)
     if as_str_list:
-        visible_layer += ']'
-    else:
-        visible_layer += '}'
+        return f"[{visible_layer}]"
 
-    return visible_layer
+    return f"{{{visible_layer}}}"
 
 
 def get_plugin_metadata(parameter, default_value, plugin_dir=None):
@@ -341,8 +338,7 @@ def get_plugin_metadata(parameter, default_value, plugin_dir=None):
 
     value = None
     try:
-        metadata = configparser.ConfigParser(comment_prefixes=["#", ";"], allow_no_value=True, strict=False)
-        metadata.read(metadata_file)
+        metadata = _read_metadata(metadata_file)
         value = metadata.get('general', parameter)
     except configparser.NoOptionError:
         message = f"Parameter not found: {parameter}"
@@ -407,13 +403,7 @@ def is_plugin_available(plugin_name: str) -> bool:
     :param plugin_name: The 'name' parameter from the plugin's metadata.
     :return: True if the plugin is available, False otherwise.
     """
-    for folder_name in available_plugins:
-        plugin_dir = find_plugin_path(folder_name)
-        if plugin_dir:
-            metadata_name = get_plugin_metadata('name', default_value=None, plugin_dir=plugin_dir)
-            if metadata_name == plugin_name:
-                return True
-    return False
+    return bool(_get_plugin_folders(plugin_name))
 
 
 def is_plugin_active(plugin_name: str) -> bool:
@@ -423,13 +413,7 @@ def is_plugin_active(plugin_name: str) -> bool:
     :param plugin_name: The 'name' parameter from the plugin's metadata.
     :return: True if the plugin is active, False otherwise.
     """
-    for folder_name in active_plugins:
-        plugin_dir = find_plugin_path(folder_name)
-        if plugin_dir:
-            metadata_name = get_plugin_metadata('name', default_value=None, plugin_dir=plugin_dir)
-            if metadata_name == plugin_name:
-                return True
-    return False
+    return any(folder_name in active_plugins for folder_name in _get_plugin_folders(plugin_name))
 
 
 def get_plugin_folder(plugin_name: str) -> Optional[str]:
@@ -439,13 +423,8 @@ def get_plugin_folder(plugin_name: str) -> Optional[str]:
     :param plugin_name: The 'name' parameter from the plugin's metadata.
     :return: The folder name of the plugin if found, None otherwise.
     """
-    for folder_name in available_plugins:
-        plugin_dir = find_plugin_path(folder_name)
-        if plugin_dir:
-            metadata_name = get_plugin_metadata('name', default_value=None, plugin_dir=plugin_dir)
-            if metadata_name == plugin_name:
-                return folder_name
-    return None
+    folders = _get_plugin_folders(plugin_name)
+    return folders[0] if folders else None
 
 
 def enable_python_console():
@@ -480,9 +459,7 @@ def set_project_variable(var_name, value):
     """ Set project variable """
 
     try:
-        custom_vars = QgsProject.instance().customVariables()
-        custom_vars[var_name] = value
-        QgsProject.instance().setCustomVariables(custom_vars)
+        QgsExpressionContextUtils.setProjectVariable(QgsProject.instance(), var_name, value)
     except Exception:
         pass
     finally:
@@ -500,17 +477,11 @@ def get_project_layers():
 def find_toc_group(root, group, case_sensitive=False):
     """ Find a group of layers in the ToC """
 
-    for grp in root.findGroups():
-        group1 = grp.name()
-        group2 = group
-        if not case_sensitive:
-            group1 = group1.lower()
-            group2 = group2.lower()
+    if case_sensitive:
+        return next((grp for grp in root.findGroups() if grp.name() == group), None)
 
-        if group1 == group2:
-            return grp
-
-    return None
+    group = group.lower()
+    return next((grp for grp in root.findGroups() if grp.name().lower() == group), None)
 
 
 def get_layer_source(layer):
@@ -527,26 +498,7 @@ def get_layer_source(layer):
         return layer_source
 
     # Get dbname, host, port, user and password
-    uri = layer.dataProvider().dataSourceUri()
-
-    # split with quoted substrings preservation
-    splt = shlex.split(uri)
-
-    list_uri = []
-    for v in splt:
-        if '=' in v:
-            elem_uri = tuple(v.split('='))
-            if len(elem_uri) == 2:
-                list_uri.append(elem_uri)
-
-    splt_dct = dict(list_uri)
-    if 'service' in splt_dct:
-        splt_dct['service'] = splt_dct['service']
-    if 'dbname' in splt_dct:
-        splt_dct['db'] = splt_dct['dbname']
-    if 'table' in splt_dct:
-        splt_dct['schema'], splt_dct['table'] = splt_dct['table'].split('.')
-
+    splt_dct = _split_uri(layer.dataProvider().dataSourceUri())
     for key in layer_source.keys():
         layer_source[key] = splt_dct.get(key)
 
@@ -561,17 +513,7 @@ def get_layer_source_table_name(layer):
 
     provider = layer.providerType()
     if provider == 'postgres':
-        uri = layer.dataProvider().dataSourceUri().lower()
-        pos_ini = uri.find('table=')
-        total = len(uri)
-        pos_end_schema = uri.rfind('.')
-        pos_fi = uri.find('" ')
-        if uri.find('pg:') != -1:
-            uri_table = uri[pos_ini + 6:total]
-        elif pos_ini != -1 and pos_fi != -1:
-            uri_table = uri[pos_end_schema + 2:pos_fi]
-        else:
-            uri_table = uri[pos_end_schema + 2:total - 1]
+        uri_table = _parse_uri(layer.dataProvider().dataSourceUri())[0]
     elif provider == 'ogr' and layer.source().split('|')[0].endswith('.gpkg'):
         uri_table = ""
         parts = layer.source().split('|')  # Split by the pipe character '|'
@@ -593,15 +535,7 @@ def get_layer_schema(layer):
     if layer.providerType() != 'postgres':
         return None
 
-    table_schema = None
-    uri = layer.dataProvider().dataSourceUri().lower()
-
-    pos_ini = uri.find('table=')
-    pos_end_schema = uri.rfind('.')
-    pos_fi = uri.find('" ')
-    if pos_ini != -1 and pos_fi != -1:
-        table_schema = uri[pos_ini + 7:pos_end_schema - 1]
-
+    table_schema = _parse_uri(layer.dataProvider().dataSourceUri())[1]
     return table_schema
 
 
@@ -613,24 +547,17 @@ def get_primary_key(layer=None):
         layer = iface.activeLayer()
     if layer is None:
         return uri_pk
-    uri = layer.dataProvider().dataSourceUri().lower()
-    pos_ini = uri.find('key=')
-    pos_end = uri.rfind('srid=')
-    if pos_ini != -1:
-        uri_pk = uri[pos_ini + 5:pos_end - 2]
-
+    uri_pk = _parse_uri(layer.dataProvider().dataSourceUri())[2]
     return uri_pk
 
 
 def get_layer_by_tablename(tablename, show_warning_=False, log_info=False, schema_name=None):
-    """ Iterate over all layers and get the one with selected @tablename """
+    """ Get the first layer of the TOC with selected @tablename """
 
     # Check if we have any layer loaded
-    layers = get_project_layers()
-    if len(layers) == 0:
+    if QgsProject.instance().count() == 0:
         return None
 
-    # Iterate over all layers
     layer = None
     if schema_name is None:
         if 'main_schema' in lib_vars.project_vars:
@@ -638,10 +565,8 @@ def get_layer_by_tablename(tablename, show_warning_=False, log_info=False, schem
         else:
             tools_log.log_warning("Key not found", parameter='main_schema')
 
-    for cur_layer in layers:
-        uri_table = get_layer_source_table_name(cur_layer)
-        table_schema = get_layer_schema(cur_layer)
-        if (uri_table is not None and uri_table == tablename) and schema_name in ('', None, table_schema):
+    for table_schema, cur_layer in _get_layer_index().get(tablename, ()):
+        if schema_name in ('', None, table_schema):
             layer = cur_layer
             break
 
@@ -725,22 +650,16 @@ def add_layer_from_query(query: str, layer_name: str = "QueryLayer",
     else:
         querytext = f"({query})"
 
-    # Set the SQL query and the geometry column (initially without geom_column)
-    uri.setDataSource("", f"({query})", "", "", key_column)
-
-    # Create a provisional layer
-    provisional_layer  = QgsVectorLayer(uri.uri(False), f"{layer_name}", "postgres")
-
-    # Check if the provisional layer is valid
-    if not provisional_layer.isValid():
+    # Get the columns of the query from the database instead of loading a provisional layer
+    columns = tools_db.get_query_columns(query)
+    if columns is None:
         tools_log.log_error("Layer failed to load!", parameter=querytext)
         return
 
-    # Check if the geometry column exists in the provisional layer
-    fields = provisional_layer.fields()
-    if geom_column in fields.names():
-        # Update uri to include the geometry column
-        uri.setDataSource("", querytext, geom_column, "", key_column)
+    # Set the SQL query and the geometry column, if the query returns it
+    if geom_column not in columns:
+        geom_column = ""
+    uri.setDataSource("", querytext, geom_column, "", key_column)
 
     # Create the layer
     layer = QgsVectorLayer(uri.uri(False), f"{layer_name}", "postgres")
@@ -1427,6 +1346,174 @@ def get_epsg():
 
 # region private functions
 
+
+@lru_cache(maxsize=512)
+def _split_uri(uri):
+    """ Return the parameters of a postgres data source @uri as a dict (cached by uri) """
+
+    # split with quoted substrings preservation
+    splt = shlex.split(uri)
+
+    list_uri = []
+    for v in splt:
+        if '=' in v:
+            elem_uri = tuple(v.split('='))
+            if len(elem_uri) == 2:
+                list_uri.append(elem_uri)
+
+    splt_dct = dict(list_uri)
+    if 'dbname' in splt_dct:
+        splt_dct['db'] = splt_dct['dbname']
+    if 'table' in splt_dct:
+        splt_dct['schema'], splt_dct['table'] = splt_dct['table'].split('.')
+
+    return splt_dct
+
+
+@lru_cache(maxsize=512)
+def _parse_uri(uri):
+    """ Return (table name, schema, primary key) of a data source @uri (cached by uri) """
+
+    uri = uri.lower()
+    pos_ini = uri.find('table=')
+    total = len(uri)
+    pos_end_schema = uri.rfind('.')
+    pos_fi = uri.find('" ')
+    if uri.find('pg:') != -1:
+        uri_table = uri[pos_ini + 6:total]
+    elif pos_ini != -1 and pos_fi != -1:
+        uri_table = uri[pos_end_schema + 2:pos_fi]
+    else:
+        uri_table = uri[pos_end_schema + 2:total - 1]
+
+    table_schema = None
+    if pos_ini != -1 and pos_fi != -1:
+        table_schema = uri[pos_ini + 7:pos_end_schema - 1]
+
+    uri_pk = None
+    pos_ini_pk = uri.find('key=')
+    pos_end_pk = uri.rfind('srid=')
+    if pos_ini_pk != -1:
+        uri_pk = uri[pos_ini_pk + 5:pos_end_pk - 2]
+
+    return uri_table, table_schema, uri_pk
+
+
+def _get_dev_duration():
+    """ Get user parameter 'show_message_durations' as int (None if not set), converting it only when it changes """
+
+    global _dev_duration
+    value = user_parameters.get('show_message_durations')
+    if value != _dev_duration[0]:
+        _dev_duration = (value, None if value in (None, "None") else int(value))
+    return _dev_duration[1]
+
+
+def _queue_message(dialog, title, msg, message_level, duration):
+    """ Push the message to the message bar of @dialog on the next event loop iteration, together with the other
+    messages shown meanwhile. Consecutive repeated messages are only shown once """
+
+    message = (dialog, title, msg, message_level, duration)
+    # Without the main event loop the timer would never be triggered
+    app = QApplication.instance()
+    if app is None or QThread.currentThread() != app.thread():
+        _push_message(*message)
+        return
+
+    if _message_queue and _message_queue[-1] == message:
+        return
+    _message_queue.append(message)
+    if len(_message_queue) == 1:
+        QTimer.singleShot(0, _flush_messages)
+
+
+def _flush_messages():
+    """ Push the messages queued by _queue_message() """
+
+    messages = _message_queue[:]
+    _message_queue.clear()
+    for message in messages:
+        _push_message(*message)
+
+
+def _push_message(dialog, title, msg, message_level, duration):
+    """ Push a message to the message bar of @dialog, or to the QGIS one if @dialog doesn't have it """
+
+    try:
+        dialog.messageBar().pushMessage(title, msg, message_level, duration)
+    except Exception as e:  # This is because "messageBar().pushMessage" is only available for QMainWindow, not QDialog.
+        print("Exception show_message: ", e)
+        iface.messageBar().pushMessage(title, msg, message_level, duration)
+
+
+def _reset_layer_index(*args):
+    """ Discard the index of project layers by table name. It will be rebuilt on next use """
+
+    global _layer_index
+    _layer_index = None
+
+
+def _get_layer_index():
+    """ Get project layers by table name, building the index if layers have changed since last call """
+
+    global _layer_index, _layer_index_connected
+    if not _layer_index_connected:
+        project = QgsProject.instance()
+        project.layersAdded.connect(_reset_layer_index)
+        project.layersWillBeRemoved.connect(_reset_layer_index)
+        # The index may be rebuilt while layers are being removed, reset it again once they are gone
+        project.layersRemoved.connect(_reset_layer_index)
+        project.layerTreeRoot().addedChildren.connect(_reset_layer_index)
+        project.layerTreeRoot().removedChildren.connect(_reset_layer_index)
+        _layer_index_connected = True
+
+    if _layer_index is None:
+        layer_index = {}
+        for layer in get_project_layers():
+            if layer is None:
+                continue
+            if layer.id() not in _layer_index_layer_ids:
+                layer.dataSourceChanged.connect(_reset_layer_index)
+                _layer_index_layer_ids.add(layer.id())
+            uri_table = get_layer_source_table_name(layer)
+            if uri_table is not None:
+                layer_index.setdefault(uri_table, []).append((get_layer_schema(layer), layer))
+        _layer_index = layer_index
+
+    return _layer_index
+
+
+def _read_metadata(metadata_file):
+    """ Parse @metadata_file, reusing the previous result while the file is not modified """
+
+    mtime = os.stat(metadata_file).st_mtime_ns
+    cached = _metadata_cache.get(metadata_file)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    metadata = configparser.ConfigParser(comment_prefixes=["#", ";"], allow_no_value=True, strict=False)
+    metadata.read(metadata_file)
+    _metadata_cache[metadata_file] = (mtime, metadata)
+    return metadata
+
+
+def _get_plugin_folders(plugin_name):
+    """ Get folder names of available plugins whose metadata name is @plugin_name.
+    The index of names is rebuilt only when the list of available plugins changes """
+
+    global _plugin_name_index_key
+    key = tuple(available_plugins)
+    if key != _plugin_name_index_key:
+        _plugin_name_index.clear()
+        for folder_name in available_plugins:
+            plugin_dir = find_plugin_path(folder_name)
+            if plugin_dir:
+                metadata_name = get_plugin_metadata('name', default_value=None, plugin_dir=plugin_dir)
+                _plugin_name_index.setdefault(metadata_name, []).append(folder_name)
+        _plugin_name_index_key = key
+
+    return _plugin_name_index.get(plugin_name, [])
+
 def _get_vertex_from_point(feature):
     """
     Manage feature geometry when is Point
@@ -37,6 +37,8 @@ from .ui.ui_manager import ShowInfoUi
 
 translator = QTranslator()
 dlg_info = ShowInfoUi()
+_TR_CACHE_SIZE = 2048
+_tr_cache = {}  # Translations done by tr() {(message, context_name, aux_context): value}. Cleared by _add_translator()
 
 
 class GwExtendedQLabel(QLabel):
@@ -1261,6 +1263,13 @@ def tr(message, context_name="giswater", aux_context='ui_message'):
     if context_name is None:
         context_name = lib_vars.plugin_name
 
+    # Most messages are constant strings, translated many times
+    key = (message, context_name, aux_context) if isinstance(message, str) else None
+    if key is not None:
+        value = _tr_cache.get(key)
+        if value is not None:
+            return value
+
     value = None
     try:
         value = QCoreApplication.translate(context_name, message)
@@ -1271,6 +1280,11 @@ def tr(message, context_name="giswater", aux_context='ui_message'):
         if value == message:
             value = QCoreApplication.translate(aux_context, message)
 
+    if key is not None:
+        # Messages built with variable content would make it grow forever
+        if len(_tr_cache) >= _TR_CACHE_SIZE:
+            _tr_cache.clear()
+        _tr_cache[key] = value
     return value
 
 
@@ -1505,6 +1519,7 @@ def _add_translator(locale_path, log_info=False):
     if os.path.exists(locale_path):
         translator.load(locale_path)
         QCoreApplication.installTranslator(translator)
+        _tr_cache.clear()
         if log_info:
             tools_log.log_info("Add translator", parameter=locale_path)
     else: